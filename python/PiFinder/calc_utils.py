@@ -218,6 +218,7 @@ def hadec_to_pa(ha_deg, dec_deg, lat_deg):
     INPUTS:
     ha_deg, dec_deg: Hour Angle (HA) and declination of the target [deg]
     lat_deg: Latitude of the observer [deg]
+    Inputs may be scalars or numpy arrays (broadcast together).
 
     RETURNS:
     pa_deg: Parallactic angle [deg]
@@ -247,18 +248,18 @@ def hadec_to_roll(ha_deg, dec_deg, lat_deg):
     ha_deg: Hour Angle (HA) of the target [deg]
     dec_deg: Declination of the target [deg]
     lat_deg: Latitude of the observer [deg]
+    Inputs may be scalars or numpy arrays (broadcast together).
 
     RETURNS:
     roll: Roll [deg]
     """
+    ha_deg = np.asarray(ha_deg)
+    dec_deg = np.asarray(dec_deg)
     pa_deg = hadec_to_pa(ha_deg, dec_deg, lat_deg)  # Calculate the parallactic angle
 
-    if dec_deg <= lat_deg:
-        roll_deg = -pa_deg
-    else:
-        roll_deg = -pa_deg + np.sign(ha_deg) * 180
+    roll_deg = np.where(dec_deg <= lat_deg, -pa_deg, -pa_deg + np.sign(ha_deg) * 180)
 
-    return roll_deg
+    return roll_deg[()]  # unwraps 0-d results to a scalar
 
 
 def hash_dict(d):
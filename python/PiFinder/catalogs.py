@@ -837,9 +837,11 @@ class CatalogBuilder:
         catalog_obj: Dict,
         objects: Dict[int, Dict],
         common_names: Names,
-        obs_db: ObservationsDatabase,
     ) -> CompositeObject:
-        """Create a composite object with all details populated"""
+        """
+        Create a composite object with all details populated,
+        except logged, which the caller sets in bulk
+        """
         object_id = catalog_obj["object_id"]
         obj_data = objects[object_id]
 
@@ -860,7 +862,6 @@ class CatalogBuilder:
 
         composite_instance = CompositeObject.from_dict(composite_data)
         composite_instance.names = common_names.id_to_names.get(object_id, [])
-        composite_instance.logged = obs_db.check_logged(composite_instance)
 
         # Parse magnitude
         try:
@@ -902,10 +903,10 @@ class CatalogBuilder:
         # Load priority catalogs synchronously (fast - ~13K objects)
         composite_objects = []
         for catalog_obj in priority_objects:
-            obj = self._create_full_composite_object(
-                catalog_obj, objects, common_names, obs_db
-            )
+            obj = self._create_full_composite_object(catalog_obj, objects, common_names)
             composite_objects.append(obj)
+        for obj in obs_db.filter_logged(composite_objects):
+            obj.logged = True
 
         # Store reference for background loader completion callback
         self._pending_catalogs_ref = None
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from typing import Tuple
 from sqlite3 import Connection, Cursor, Error
 import logging
@@ -16,6 +17,32 @@ class Database:
         self.conn = conn
         self.cursor = cursor
         self.db_path = db_path
+        self.bulk_mode = False  # True while inside transaction()/bulk()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed writes as one transaction, committing
+        on success and rolling back on error.  When already
+        inside a transaction/bulk block, it joins the outer one.
+        """
+        if self.bulk_mode:
+            yield self
+            return
+
+        self.bulk_mode = True
+        try:
+            with self.conn:
+                yield self
+        finally:
+            self.bulk_mode = False
+
+    def bulk(self):
+        """
+        Groups many writes (e.g. logging a batch or restoring
+        a backup) into a single transaction
+        """
+        return self.transaction()
 
     def get_conn_cursor(self) -> Tuple[Connection, Cursor]:
         return self.conn, self.cursor
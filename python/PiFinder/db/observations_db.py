@@ -1,11 +1,20 @@
-import json
+import logging
+import time
 from pathlib import Path
 from typing import Tuple
+import orjson
 from sqlite3 import Connection, Cursor
 from PiFinder.db.db import Database
 import PiFinder.utils as utils
 from PiFinder.composite_object import CompositeObject
 
+logger = logging.getLogger("Observation.Database")
+
+# Buffered (auto_commit=False) observations are written out once
+# this many rows are pending, or the oldest one is this old
+PENDING_FLUSH_SIZE = 50
+PENDING_FLUSH_SECONDS = 30
+
 
 class ObservationsDatabase(Database):
     def __init__(self, db_path: Path = utils.observations_db):
@@ -14,8 +23,24 @@ class ObservationsDatabase(Database):
             new_db = True
         conn, cursor = self.get_database(db_path)
         super().__init__(conn, cursor, db_path)
+
+        # observations.db is user data that backup/restore copy as a
+        # single file, so it stays on the rollback journal with full
+        # sync: every commit is in the main file.  Setting DELETE also
+        # converts a db left in WAL mode back to a single file.
+        self.cursor.execute("PRAGMA journal_mode = DELETE;")
+        self.cursor.execute("PRAGMA cache_size = -16000;")  # 16MB cache
+        self.cursor.execute("PRAGMA temp_store = MEMORY;")
+
         if new_db:
             self.create_tables()
+        else:
+            # upgrade databases created before the index existed
+            self.create_indexes()
+
+        # observation rows waiting to be written by flush()
+        self._pending: list[tuple] = []
+        self._pending_since = 0.0
 
         self.load_observed_objects_cache()
 
@@ -25,33 +50,46 @@ class ObservationsDatabase(Database):
         """
 
         # initialize tables
-        self.cursor.execute(
-            """
-               CREATE TABLE obs_sessions(
-                    id INTEGER PRIMARY KEY,
-                    start_time_local INTEGER,
-                    lat NUMERIC,
-                    lon NUMERIC,
-                    timezone TEXT,
-                    UID TEXT
-               )
-            """
-        )
+        with self.transaction():
+            self.cursor.execute(
+                """
+                   CREATE TABLE obs_sessions(
+                        id INTEGER PRIMARY KEY,
+                        start_time_local INTEGER,
+                        lat NUMERIC,
+                        lon NUMERIC,
+                        timezone TEXT,
+                        UID TEXT
+                   )
+                """
+            )
 
-        self.cursor.execute(
-            """
-               CREATE TABLE obs_objects(
-                    id INTEGER PRIMARY KEY,
-                    session_uid TEXT,
-                    obs_time_local INTEGER,
-                    catalog TEXT,
-                    sequence INTEGER,
-                    solution TEXT,
-                    notes TEXT
-               )
-            """
-        )
-        self.conn.commit()
+            self.cursor.execute(
+                """
+                   CREATE TABLE obs_objects(
+                        id INTEGER PRIMARY KEY,
+                        session_uid TEXT,
+                        obs_time_local INTEGER,
+                        catalog TEXT,
+                        sequence INTEGER,
+                        solution TEXT,
+                        notes TEXT
+                   )
+                """
+            )
+            self.create_indexes()
+
+    def create_indexes(self):
+        """
+        Creates the lookup indexes, if missing
+        """
+        with self.transaction():
+            self.cursor.execute(
+                """
+                   CREATE INDEX IF NOT EXISTS idx_obs_cat_seq
+                   ON obs_objects(catalog, sequence)
+                """
+            )
 
     def get_observations_database(self) -> Tuple[Connection, Cursor]:
         return self.get_database(utils.observations_db)
@@ -65,29 +103,99 @@ class ObservationsDatabase(Database):
                 timezone,
                 uid
             )
-            VALUES
-            (
-                :start_time,
-                :lat,
-                :lon,
-                :timezone,
-                :uuid
+            VALUES (?, ?, ?, ?, ?)
+        """
+
+        with self.transaction():
+            self.cursor.execute(q, (start_time, lat, lon, timezone, uuid))
+
+    def log_object(
+        self,
+        session_uuid,
+        obs_time,
+        catalog,
+        sequence,
+        solution,
+        notes,
+        auto_commit=True,
+    ):
+        """
+        Logs a single observation.
+
+        With auto_commit the row (and anything already buffered)
+        is written right away and the new observation id is
+        returned.
+
+        Without auto_commit the row is only buffered and None is
+        returned.  Buffered rows are written by flush()/close(),
+        or by a later log_object call once PENDING_FLUSH_SIZE rows
+        are waiting or the oldest is PENDING_FLUSH_SECONDS old.
+        There is no background timer, so callers using the buffer
+        must flush themselves or rows are lost on exit.  Until
+        they are written, buffered rows are not seen by
+        check_logged or the get_logs_* queries.
+        """
+        if not self._pending:
+            self._pending_since = time.time()
+
+        self._pending.append(
+            self._serialize_row(
+                session_uuid, obs_time, catalog, sequence, solution, notes
             )
+        )
+
+        if auto_commit:
+            return self.flush()
+
+        if (
+            len(self._pending) >= PENDING_FLUSH_SIZE
+            or time.time() - self._pending_since >= PENDING_FLUSH_SECONDS
+        ):
+            self.flush()
+
+        return None
+
+    def log_objects(self, rows):
         """
+        Logs many observations in a single transaction,
+        along with anything already buffered.
+        rows is an iterable of
+        (session_uuid, obs_time, catalog, sequence, solution, notes)
+        tuples. Returns the id of the last observation written.
+        """
+        new_rows = [self._serialize_row(*row) for row in rows]
+        pending_rows, self._pending = self._pending, []
+        return self._write_rows(pending_rows + new_rows)
 
-        self.cursor.execute(
-            q,
-            {
-                "start_time": start_time,
-                "lat": lat,
-                "lon": lon,
-                "timezone": timezone,
-                "uuid": uuid,
-            },
+    def flush(self):
+        """
+        Writes out any buffered observations in a single
+        transaction and returns the id of the last one
+        """
+        pending_rows, self._pending = self._pending, []
+        return self._write_rows(pending_rows)
+
+    def _serialize_row(
+        self, session_uuid, obs_time, catalog, sequence, solution, notes
+    ) -> tuple:
+        return (
+            session_uuid,
+            obs_time,
+            catalog,
+            sequence,
+            utils.serialize_solution(solution),
+            orjson.dumps(notes).decode(),
         )
-        self.conn.commit()
 
-    def log_object(self, session_uuid, obs_time, catalog, sequence, solution, notes):
+    def _write_rows(self, rows):
+        """
+        Inserts the serialized rows in one transaction.
+        On failure nothing is written, the rows are
+        logged as lost and the error is re-raised.
+        """
+        if not rows:
+            return None
+
         q = """
             INSERT INTO obs_objects(
                 session_uid,
@@ -97,34 +205,20 @@ class ObservationsDatabase(Database):
                 solution,
                 notes
             )
-            VALUES
-            (
-                :session_uuid,
-                :obs_time,
-                :catalog,
-                :sequence,
-                :solution,
-                :notes
-            )
+            VALUES (?, ?, ?, ?, ?, ?)
         """
 
-        self.cursor.execute(
-            q,
-            {
-                "session_uuid": session_uuid,
-                "obs_time": obs_time,
-                "catalog": catalog,
-                "sequence": sequence,
-                "solution": utils.serialize_solution(solution),
-                "notes": json.dumps(notes),
-            },
-        )
-        self.conn.commit()
+        try:
+            with self.transaction():
+                # lastrowid is only set by execute(), so the last
+                # row goes through it to give us its id for free
+                self.cursor.executemany(q, rows[:-1])
+                self.cursor.execute(q, rows[-1])
+        except Exception:
+            logger.exception("Could not write %d observation(s): %s", len(rows), rows)
+            raise
 
-        observation_id = self.cursor.execute(
-            "select last_insert_rowid() as id"
-        ).fetchone()["id"]
-        return observation_id
+        return self.cursor.lastrowid
 
     def get_observed_objects(self):
         """
@@ -132,7 +226,8 @@ class ObservationsDatabase(Database):
         """
         logs = self.cursor.execute(
             """
-                select distinct catalog, sequence from obs_objects
+                select catalog, sequence from obs_objects
+                group by catalog, sequence
             """
         ).fetchall()
 
@@ -142,9 +237,9 @@ class ObservationsDatabase(Database):
         """
         (re)Loads the logged object cache
         """
-        self.observed_objects_cache: list[tuple[str, int]] = [
+        self.observed_objects_cache: set[tuple[str, int]] = {
             (x["catalog"], x["sequence"]) for x in self.get_observed_objects()
-        ]
+        }
 
     def check_logged(self, obj_record: CompositeObject):
         """
@@ -162,6 +257,22 @@ class ObservationsDatabase(Database):
 
         return False
 
+    def filter_logged(self, obj_records):
+        """
+        Returns the records from obj_records which have been
+        observed.  Bulk form of check_logged for long lists.
+        """
+        # safety check
+        if self.observed_objects_cache is None:
+            self.load_observed_objects_cache()
+
+        cache = self.observed_objects_cache
+        return [
+            obj_record
+            for obj_record in obj_records
+            if (obj_record.catalog_code, obj_record.sequence) in cache
+        ]
+
     def get_logs_for_object(self, obj_record: CompositeObject):
         """
         Returns a list of observations for a particular object
@@ -178,7 +289,10 @@ class ObservationsDatabase(Database):
         return logs
 
     def close(self):
-        self.conn.close()
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
 
     def get_sessions(self, session_uid=None):
         """
@@ -188,48 +302,51 @@ class ObservationsDatabase(Database):
         entries for the same PiFinder software run
         so this does some sanitizing of the data
 
+        Sessions without observations drop out of the join
         """
         q = """
                 Select
-                    uid,
-                    timezone,
-                    datetime(min(start_time_local), "unixepoch") as start_time_local,
-                    avg(lat) as lat,
-                    avg(lon) as lon
-                from obs_sessions
+                    sess.uid as UID,
+                    sess.timezone,
+                    sess.start_time_local,
+                    sess.lat,
+                    sess.lon,
+                    obs.observations,
+                    obs.duration
+                from (
+                    select
+                        uid,
+                        timezone,
+                        datetime(min(start_time_local), "unixepoch") as start_time_local,
+                        avg(lat) as lat,
+                        avg(lon) as lon
+                    from obs_sessions
             """
         if session_uid is not None:
             # add in a where clause
             q += """
-                where uid= :sess_uid
+                    where uid= :sess_uid
             """
 
         q += """
-                group by 1,2
-                order by start_time_local
-            """
-
-        sessions = self.cursor.execute(q, {"sess_uid": session_uid}).fetchall()
-
-        # now enrich them....
-        ret_sessions = []
-        for sess in sessions:
-            sess = dict(sess)
-            _sess_info = self.cursor.execute(
-                """
+                    group by 1,2
+                ) as sess
+                join (
                     select
+                        session_uid,
                         count(*) as observations,
                         (max(obs_time_local) - min(obs_time_local)) / 60 /60 as duration
                     from obs_objects
-                    where session_uid= :sess_uid
-                """,
-                {"sess_uid": sess["UID"]},
-            ).fetchone()
-            sess = sess | dict(_sess_info)
-            if sess["observations"] > 0:
-                ret_sessions.append(sess)
+                    group by session_uid
+                ) as obs
+                on obs.session_uid = sess.uid
+                order by sess.start_time_local
+            """
 
-        return ret_sessions
+        return [
+            dict(sess)
+            for sess in self.cursor.execute(q, {"sess_uid": session_uid}).fetchall()
+        ]
 
     def get_session(self, session_uid):
         """
@@ -242,7 +359,15 @@ class ObservationsDatabase(Database):
         """
         returns a list of observed objects for session
         """
-        objects = self.cursor.execute(
+        return self.iter_logs_by_session(session_uid).fetchall()
+
+    def iter_logs_by_session(self, session_uid):
+        """
+        returns a cursor over the observed objects for session.
+        Uses its own cursor so rows can be consumed lazily
+        while other queries run.
+        """
+        return self.conn.execute(
             """
                 Select
                     session_uid,
@@ -254,16 +379,15 @@ class ObservationsDatabase(Database):
                 where session_uid= :session_uid
             """,
             {"session_uid": session_uid},
-        ).fetchall()
-
-        return objects
+        )
 
     def observations_as_tsv(self, session_uid=None):
         """
-        Returns all observations for a session
-        or all sessions
+        Yields all observations for a session
+        or all sessions as TSV lines, header first,
+        so they can be streamed without building
+        the whole file in memory
         """
-        rows_list = []
         headers_list = [
             "Session_ID",
             "Session_Start_Time",
@@ -275,7 +399,7 @@ class ObservationsDatabase(Database):
             "Sequence",
             "Notes",
         ]
-        rows_list.append("\t".join(headers_list))
+        yield "\t".join(headers_list) + "\n"
 
         sessions = self.get_sessions(session_uid=session_uid)
         for session in sessions:
@@ -286,14 +410,17 @@ class ObservationsDatabase(Database):
                 str(session["lat"]),
                 str(session["lon"]),
             ]
-            objects = self.get_logs_by_session(session["UID"])
-            for obj in objects:
-                object_row = base_row + [
-                    obj["obs_time_local"],
-                    obj["catalog"],
-                    str(obj["sequence"]),
-                    obj["notes"],
-                ]
-                rows_list.append("\t".join(object_row))
-
-        return "\n".join(rows_list)
+            # close the cursor even if the download is aborted,
+            # so it doesn't hold a WAL read snapshot until GC
+            objects = self.iter_logs_by_session(session["UID"])
+            try:
+                for obj in objects:
+                    object_row = base_row + [
+                        obj["obs_time_local"],
+                        obj["catalog"],
+                        str(obj["sequence"]),
+                        obj["notes"],
+                    ]
+                    yield "\t".join(object_row) + "\n"
+            finally:
+                objects.close()
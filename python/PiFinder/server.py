@@ -1,13 +1,15 @@
+import functools
 import io
-import json
 import logging
+import threading
 import time
 import uuid
 import os
 from datetime import datetime, timezone
 
+import orjson
 import pydeepskylog as pds
-from PIL import Image
+from PIL import Image, features
 from PiFinder import utils, calc_utils, config
 from PiFinder.db.observations_db import (
     ObservationsDatabase,
@@ -34,6 +36,43 @@ logger = logging.getLogger("Server")
 # Generate a secret to validate the auth cookie
 SESSION_SECRET = str(uuid.uuid4())
 
+# Serve /image as WebP when this Pillow build can encode it
+SCREEN_WEBP = features.check("webp")
+
+# Web remote button names to keycodes
+_BUTTON_MAP = {
+    "UP": KeyboardInterface.PLUS,
+    "DN": KeyboardInterface.MINUS,
+    "SQUARE": KeyboardInterface.SQUARE,
+    "A": KeyboardInterface.LEFT,
+    "B": KeyboardInterface.UP,
+    "C": KeyboardInterface.DOWN,
+    "D": KeyboardInterface.RIGHT,
+    "ALT_PLUS": KeyboardInterface.ALT_PLUS,
+    "ALT_MINUS": KeyboardInterface.ALT_MINUS,
+    "ALT_LEFT": KeyboardInterface.ALT_LEFT,
+    "ALT_UP": KeyboardInterface.ALT_UP,
+    "ALT_DOWN": KeyboardInterface.ALT_DOWN,
+    "ALT_RIGHT": KeyboardInterface.ALT_RIGHT,
+    "ALT_0": KeyboardInterface.ALT_0,
+    "LNG_LEFT": KeyboardInterface.LNG_LEFT,
+    "LNG_UP": KeyboardInterface.LNG_UP,
+    "LNG_DOWN": KeyboardInterface.LNG_DOWN,
+    "LNG_RIGHT": KeyboardInterface.LNG_RIGHT,
+    "LNG_SQUARE": KeyboardInterface.LNG_SQUARE,
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _fmt_solution(ra, dec):
+    """
+    Returns the (ra_text, dec_text) shown on the home page.
+    Cached so polling an unchanged solution skips the
+    conversion and formatting.
+    """
+    hh, mm, _ = calc_utils.ra_to_hms(ra)
+    return f"{hh:02.0f}h{mm:02.0f}m", f"{dec: .2f}"
+
 
 def auth_required(func):
     def auth_wrapper(*args, **kwargs):
@@ -47,6 +86,34 @@ def auth_required(func):
     return auth_wrapper
 
 
+class SessionLogRow:
+    """
+    Read-only view of an obs_objects sqlite3.Row with the
+    notes replaced by their rendered HTML, so the row
+    doesn't have to be copied into a dict for the template
+    """
+
+    __slots__ = ("row", "notes")
+
+    def __init__(self, row, notes):
+        self.row = row
+        self.notes = notes
+
+    def __getitem__(self, key):
+        if key == "notes":
+            return self.notes
+        return self.row[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (IndexError, KeyError):
+            return default
+
+    def keys(self):
+        return self.row.keys()
+
+
 class Server:
     def __init__(
         self,
@@ -58,43 +125,35 @@ class Server:
         is_debug=False,
     ):
         self.version_txt = f"{utils.pifinder_dir}/version.txt"
+        # the version can't change while we're running, read it once
+        self.software_version = "Unknown"
+        try:
+            with open(self.version_txt, "r") as ver_f:
+                self.software_version = ver_f.read()
+        except (FileNotFoundError, IOError) as e:
+            logger.warning(f"Could not read version file: {str(e)}")
         self.keyboard_queue = keyboard_queue
         self.ui_queue = ui_queue
         self.gps_queue = gps_queue
         self.log_queue = log_queue
         self.shared_state = shared_state
-        self.ki = KeyboardInterface()
         # gps info
         self.lat = None
         self.lon = None
         self.altitude = None
         self.gps_locked = False
+        # observations db connections, one per server thread.
+        # Bumping the generation makes every thread reopen its
+        # connection on next use.
+        self._obs_db_local = threading.local()
+        self._obs_db_generation = 0
+        # format -> (screen_id, encoded bytes) of the last screen
+        # served by /image
+        self._screen_images: dict[str, tuple] = {}
 
         if is_debug:
             logger.setLevel(logging.DEBUG)
 
-        button_dict = {
-            "UP": self.ki.PLUS,
-            "DN": self.ki.MINUS,
-            "SQUARE": self.ki.SQUARE,
-            "A": self.ki.LEFT,
-            "B": self.ki.UP,
-            "C": self.ki.DOWN,
-            "D": self.ki.RIGHT,
-            "ALT_PLUS": self.ki.ALT_PLUS,
-            "ALT_MINUS": self.ki.ALT_MINUS,
-            "ALT_LEFT": self.ki.ALT_LEFT,
-            "ALT_UP": self.ki.ALT_UP,
-            "ALT_DOWN": self.ki.ALT_DOWN,
-            "ALT_RIGHT": self.ki.ALT_RIGHT,
-            "ALT_0": self.ki.ALT_0,
-            "LNG_LEFT": self.ki.LNG_LEFT,
-            "LNG_UP": self.ki.LNG_UP,
-            "LNG_DOWN": self.ki.LNG_DOWN,
-            "LNG_RIGHT": self.ki.LNG_RIGHT,
-            "LNG_SQUARE": self.ki.LNG_SQUARE,
-        }
-
         self.network = sys_utils.Network()
 
         app = Bottle()
@@ -115,14 +174,6 @@ class Server:
         @app.route("/")
         def home():
             logger.debug("/ called")
-            # Get version info
-            software_version = "Unknown"
-            try:
-                with open(self.version_txt, "r") as ver_f:
-                    software_version = ver_f.read()
-            except (FileNotFoundError, IOError) as e:
-                logger.warning(f"Could not read version file: {str(e)}")
-
             # Try to update GPS state
             try:
                 self.update_gps()
@@ -146,16 +197,16 @@ class Server:
                     camera_icon = "camera_alt"
                     solution = self.shared_state.solution()
                     if solution:
-                        hh, mm, _ = calc_utils.ra_to_hms(solution["RA"])
-                        ra_text = f"{hh:02.0f}h{mm:02.0f}m"
-                        dec_text = f"{solution['Dec']: .2f}"
+                        ra_text, dec_text = _fmt_solution(
+                            solution["RA"], solution["Dec"]
+                        )
             except Exception as e:
                 logger.error(f"Failed to get solution data: {str(e)}")
 
             # Render the template with available data
             return template(
                 "index",
-                software_version=software_version,
+                software_version=self.software_version,
                 wifi_mode=self.network.wifi_mode(),
                 ip=self.network.local_ip(),
                 network_name=self.network.get_connected_ssid(),
@@ -716,9 +767,9 @@ class Server:
         @app.route("/observations")
         @auth_required
         def obs_sessions():
-            obs_db = ObservationsDatabase()
+            obs_db = self.obs_db()
             if request.query.get("download", 0) == "1":
-                # Download all as TSV
+                # Download all as TSV, streamed line by line
                 observations = obs_db.observations_as_tsv()
 
                 response.set_header(
@@ -739,9 +790,9 @@ class Server:
         @app.route("/observations/<session_id>")
         @auth_required
         def obs_session(session_id):
-            obs_db = ObservationsDatabase()
+            obs_db = self.obs_db()
             if request.query.get("download", 0) == "1":
-                # Download all as TSV
+                # Download all as TSV, streamed line by line
                 observations = obs_db.observations_as_tsv(session_id)
 
                 response.set_header(
@@ -753,14 +804,16 @@ class Server:
 
             session = obs_db.get_sessions(session_id)[0]
             objects = obs_db.get_logs_by_session(session_id)
-            ret_objects = []
-            for obj in objects:
-                obj_ = dict(obj)
-                obj_notes = json.loads(obj_["notes"])
-                obj_["notes"] = "<br>".join(
-                    [f"{key}: {value}" for key, value in obj_notes.items()]
+            ret_objects = [
+                SessionLogRow(
+                    obj,
+                    "<br>".join(
+                        f"{key}: {value}"
+                        for key, value in orjson.loads(obj["notes"]).items()
+                    ),
                 )
-                ret_objects.append(obj_)
+                for obj in objects
+            ]
             return template("obs_session_log", session=session, objects=ret_objects)
 
         @app.route("/tools")
@@ -887,6 +940,7 @@ class Server:
         @app.route("/tools/backup")
         @auth_required
         def tools_backup():
+            self.close_obs_dbs()
             _backup_file = sys_utils.backup_userdata()
 
             # Assumes the standard backup location
@@ -895,6 +949,7 @@ class Server:
         @app.route("/tools/restore", method="post")
         @auth_required
         def tools_restore():
+            self.close_obs_dbs()
             sys_utils.remove_backup()
             backup_file = request.files.get("backup_file")
             backup_file.filename = "PiFinder_backup.zip"
@@ -910,14 +965,41 @@ class Server:
         @auth_required
         def key_callback():
             button = request.json.get("button")
-            if button in button_dict:
-                self.key_callback(button_dict[button])
-            else:
-                self.key_callback(int(button))
+            key = _BUTTON_MAP.get(button)
+            self.key_callback(key if key is not None else int(button))
             return {"message": "success"}
 
         @app.route("/image")
         def serve_pil_image():
+            # Lossless WebP is about half the size of PNG and quicker
+            # to encode, use it whenever the browser accepts it
+            if SCREEN_WEBP and "image/webp" in request.get_header("Accept", ""):
+                img_format = "WEBP"
+                save_options = {"lossless": True, "method": 0}
+            else:
+                img_format = "PNG"
+                save_options = {}
+            response.content_type = f"image/{img_format.lower()}"
+            response.set_header("Vary", "Accept")
+
+            # The screen only needs fetching and encoding when it has
+            # changed since the last request
+            screen_id = None
+            try:
+                screen_id = self.shared_state.screen_id()
+            except (BrokenPipeError, EOFError):
+                pass
+            if screen_id is not None:
+                etag = f'"screen-{screen_id}-{img_format.lower()}"'
+                response.set_header("ETag", etag)
+                response.set_header("Cache-Control", "no-cache")
+                if request.get_header("If-None-Match") == etag:
+                    response.status = 304
+                    return b""
+                cached_id, cached_img = self._screen_images.get(img_format, (None, b""))
+                if cached_id == screen_id:
+                    return cached_img
+
             empty_img = Image.new(
                 "RGB", (60, 30), color=(73, 109, 137)
             )  # create an image using PIL
@@ -926,14 +1008,15 @@ class Server:
                 img = self.shared_state.screen()
             except (BrokenPipeError, EOFError):
                 pass
-            response.content_type = "image/png"  # adjust for your image format
 
             if img is None:
                 img = empty_img
             img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format="PNG")  # adjust for your image format
+            img.save(img_byte_arr, format=img_format, **save_options)
             img_byte_arr = img_byte_arr.getvalue()
 
+            if screen_id is not None:
+                self._screen_images[img_format] = (screen_id, img_byte_arr)
             return img_byte_arr
 
         @auth_required
@@ -983,6 +1066,38 @@ class Server:
     def key_callback(self, key):
         self.keyboard_queue.put(key)
 
+    def obs_db(self) -> ObservationsDatabase:
+        """
+        Returns the observations database for the current
+        server thread, opening it on first use.  SQLite
+        connections can't be shared between threads, so
+        each worker keeps its own.
+        """
+        local = self._obs_db_local
+        obs_db = getattr(local, "obs_db", None)
+        if obs_db is not None and local.generation != self._obs_db_generation:
+            obs_db.close()
+            obs_db = None
+        if obs_db is None:
+            obs_db = ObservationsDatabase()
+            local.obs_db = obs_db
+            local.generation = self._obs_db_generation
+        return obs_db
+
+    def close_obs_dbs(self):
+        """
+        Closes the observations database connections held by
+        the server threads, so backup/restore work on a file
+        nobody here has open.  A connection can only be closed
+        by its own thread, so the others are closed the next
+        time their thread calls obs_db().
+        """
+        self._obs_db_generation += 1
+        obs_db = getattr(self._obs_db_local, "obs_db", None)
+        if obs_db is not None:
+            self._obs_db_local.obs_db = None
+            obs_db.close()
+
     def update_gps(self):
         """Update GPS information"""
         location = self.shared_state.location()
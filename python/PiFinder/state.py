@@ -263,6 +263,7 @@ class SharedStateObj:
         self.__datetime = None
         self.__datetime_time = None
         self.__screen = None
+        self.__screen_id = 0  # bumped on every set_screen
         self.__solve_pixel = config.Config().get_option("solve_pixel")
         self.__arch = None
         self.__camera_align = False
@@ -429,6 +430,14 @@ class SharedStateObj:
 
     def set_screen(self, v):
         self.__screen = v
+        self.__screen_id += 1
+
+    def screen_id(self):
+        """
+        Changes whenever a new screen is set, so consumers
+        can tell if the screen changed without fetching it
+        """
+        return self.__screen_id
 
     def cam_raw(self):
         return self.__cam_raw
@@ -243,6 +243,13 @@ def restore_userdata(zip_path):
     restores userdata
     OVERWRITES existing data!
     """
+    # A leftover WAL would be replayed into the restored db
+    # the next time it is opened, bringing back the old rows
+    sh.rm(
+        "-f",
+        "/home/pifinder/PiFinder_data/observations.db-wal",
+        "/home/pifinder/PiFinder_data/observations.db-shm",
+    )
     unzip("-d", "/", "-o", zip_path)
 
 
@@ -97,6 +97,35 @@ class TestCalcUtils:
             roll = hadec_to_roll(ha, dec, lat_deg)
             assert roll == pytest.approx(expected, abs=0.001)
 
+    def test_hadec_to_pa_vectorized(self):
+        """Unit Test: hadec_to_pa(): array inputs broadcast over all decs"""
+        lat_deg = 51.0  # Approximately Greenwich Observatory
+        dec_degs = np.array([90, 60, 51, 30, 0, -30])
+        expected_pa_degs = np.array(
+            [120.00000, 77.9774, 65.8349, 46.5827, 35.0417, 33.2789]
+        )
+
+        np.testing.assert_allclose(
+            hadec_to_pa(60.0, dec_degs, lat_deg), expected_pa_degs, atol=1e-3
+        )
+        np.testing.assert_allclose(
+            hadec_to_pa(-60.0, dec_degs, lat_deg), -expected_pa_degs, atol=1e-3
+        )
+
+    def test_hadec_to_roll_vectorized(self):
+        """Unit Test: hadec_to_roll(): array inputs give the scalar results"""
+        lat_deg = 51.0  # Approximately Greenwich Observatory
+        ha_degs = np.repeat([60.0, -60.0], 6)
+        dec_degs = np.tile([90, 60, 51, 30, 0, -30], 2)
+
+        rolls = hadec_to_roll(ha_degs, dec_degs, lat_deg)
+        expected = [
+            hadec_to_roll(ha, dec, lat_deg) for ha, dec in zip(ha_degs, dec_degs)
+        ]
+        assert rolls.shape == (12,)
+        np.testing.assert_allclose(rolls, expected, atol=1e-9)
+        assert np.ndim(hadec_to_roll(60.0, 30.0, lat_deg)) == 0
+
     def test_hadec_to_roll2(self):
         """Unit Test against observed roll data: haddec_to_roll()"""
         # Define the inputs:
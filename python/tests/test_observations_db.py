@@ -0,0 +1,263 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from PiFinder.db import observations_db
+from PiFinder.db.observations_db import ObservationsDatabase
+
+
+@pytest.fixture
+def obs_db(tmp_path):
+    db = ObservationsDatabase(tmp_path / "observations.db")
+    db.create_obs_session(1700000000, 50.0, 3.0, "Europe/Brussels", "sess-1")
+    yield db
+    db.close()
+
+
+def _row(catalog, sequence, obs_time=1700000100):
+    return (
+        "sess-1",
+        obs_time,
+        catalog,
+        sequence,
+        {"RA": 10.0, "Dec": 20.0},
+        {"schema_ver": 2, "seeing": "NA"},
+    )
+
+
+def _obj(catalog_code, sequence):
+    # stand-in for a CompositeObject, only the fields the cache keys on
+    return SimpleNamespace(catalog_code=catalog_code, sequence=sequence)
+
+
+@pytest.mark.unit
+def test_log_object_returns_id(obs_db):
+    first_id = obs_db.log_object(*_row("M", 31))
+    second_id = obs_db.log_object(*_row("M", 32))
+    assert second_id == first_id + 1
+    assert len(obs_db.get_logs_by_session("sess-1")) == 2
+
+
+@pytest.mark.unit
+def test_log_objects_batch(obs_db):
+    last_id = obs_db.log_objects([_row("NGC", seq) for seq in range(1, 11)])
+    assert last_id == 10
+    assert len(obs_db.get_logs_by_session("sess-1")) == 10
+
+
+@pytest.mark.unit
+def test_buffered_log_object_flush(obs_db):
+    assert obs_db.log_object(*_row("M", 1), auto_commit=False) is None
+    assert obs_db.get_logs_by_session("sess-1") == []
+    obs_db.flush()
+    assert len(obs_db.get_logs_by_session("sess-1")) == 1
+
+
+@pytest.mark.unit
+def test_check_logged(obs_db):
+    obs_db.log_objects([_row("M", 31), _row("M", 31), _row("NGC", 7000)])
+    obs_db.load_observed_objects_cache()
+    assert obs_db.observed_objects_cache == {("M", 31), ("NGC", 7000)}
+    assert obs_db.check_logged(_obj("M", 31))
+    assert not obs_db.check_logged(_obj("M", 32))
+
+
+@pytest.mark.unit
+def test_catalog_sequence_index(obs_db):
+    plan = obs_db.cursor.execute(
+        "explain query plan select * from obs_objects"
+        " where catalog = 'M' and sequence = 31"
+    ).fetchall()
+    assert "idx_obs_cat_seq" in " ".join(row["detail"] for row in plan)
+
+
+@pytest.mark.unit
+def test_observations_as_tsv(obs_db):
+    obs_db.log_objects([_row("M", 31), _row("NGC", 7000)])
+    lines = list(obs_db.observations_as_tsv())
+    assert len(lines) == 3
+    assert lines[0].startswith("Session_ID\t")
+    assert all(line.endswith("\n") for line in lines)
+    assert lines[2].split("\t")[6:8] == ["NGC", "7000"]
+    assert list(obs_db.observations_as_tsv("no-such-session")) == lines[:1]
+
+
+@pytest.mark.unit
+def test_log_object_numpy_solution(obs_db):
+    np = pytest.importorskip("numpy")
+    solution = {
+        "RA": np.float64(10.5),
+        "Dec": np.float64(20.25),
+        "Matches": np.uint16(12),
+        "Roll": float("nan"),
+        "camera_center": {"Alt": np.float64(45.0), "Az": np.float64(180.0)},
+    }
+    obs_id = obs_db.log_object(
+        "sess-1", 1700000100, "M", 31, solution, {"seeing": "NA"}
+    )
+    row = obs_db.cursor.execute(
+        "select solution, notes from obs_objects where id = ?", (obs_id,)
+    ).fetchone()
+    assert '"camera_center": {"Alt": 45.0, "Az": 180.0}' in row["solution"]
+    assert '"Roll": NaN' in row["solution"]
+    assert row["notes"] == '{"seeing":"NA"}'
+
+
+@pytest.mark.unit
+def test_log_objects_single_transaction(obs_db, monkeypatch):
+    monkeypatch.setattr(observations_db, "PENDING_FLUSH_SIZE", 5)
+    last_id = obs_db.log_objects([_row("NGC", seq) for seq in range(1, 13)])
+    assert last_id == 12
+    assert obs_db._pending == []
+
+
+@pytest.mark.unit
+def test_buffered_log_object_thresholds(obs_db, monkeypatch):
+    monkeypatch.setattr(observations_db, "PENDING_FLUSH_SIZE", 3)
+    assert obs_db.log_object(*_row("M", 1), auto_commit=False) is None
+    assert obs_db.log_object(*_row("M", 2), auto_commit=False) is None
+    assert obs_db.get_logs_by_session("sess-1") == []
+    # size threshold writes the buffer, but still returns None
+    assert obs_db.log_object(*_row("M", 3), auto_commit=False) is None
+    assert len(obs_db.get_logs_by_session("sess-1")) == 3
+
+    # time threshold fires on the next call once the oldest row is too old
+    now = time.time()
+    monkeypatch.setattr(observations_db.time, "time", lambda: now)
+    obs_db.log_object(*_row("M", 4), auto_commit=False)
+    monkeypatch.setattr(
+        observations_db.time,
+        "time",
+        lambda: now + observations_db.PENDING_FLUSH_SECONDS,
+    )
+    assert obs_db.log_object(*_row("M", 5), auto_commit=False) is None
+    assert len(obs_db.get_logs_by_session("sess-1")) == 5
+
+
+@pytest.mark.unit
+def test_failed_flush_drops_batch(obs_db):
+    obs_db.log_object(*_row(["bad"], 1), auto_commit=False)
+    with pytest.raises(sqlite3.Error):
+        obs_db.flush()
+    assert obs_db._pending == []
+    assert obs_db.get_logs_by_session("sess-1") == []
+    # later valid observations are not blocked by the failed batch
+    assert obs_db.log_object(*_row("M", 31)) == 1
+
+
+@pytest.mark.unit
+def test_observations_as_tsv_abort_closes_cursor(obs_db, monkeypatch):
+    obs_db.log_objects([_row("M", 31), _row("NGC", 7000)])
+    cursors = []
+    iter_logs = obs_db.iter_logs_by_session
+
+    def _tracking_iter(session_uid):
+        cursors.append(iter_logs(session_uid))
+        return cursors[-1]
+
+    monkeypatch.setattr(obs_db, "iter_logs_by_session", _tracking_iter)
+    lines = obs_db.observations_as_tsv()
+    next(lines)
+    next(lines)
+    lines.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cursors[0].fetchone()
+
+
+@pytest.mark.unit
+def test_bulk_commits_once_and_rolls_back(obs_db):
+    with obs_db.bulk():
+        obs_db.create_obs_session(1700000200, 50.0, 3.0, "UTC", "sess-2")
+        obs_db.log_object(*_row("M", 31))
+        assert obs_db.conn.in_transaction
+    assert not obs_db.conn.in_transaction
+    assert len(obs_db.get_logs_by_session("sess-1")) == 1
+
+    with pytest.raises(RuntimeError):
+        with obs_db.bulk():
+            obs_db.create_obs_session(1700000300, 50.0, 3.0, "UTC", "sess-3")
+            obs_db.log_object(*_row("M", 32))
+            raise RuntimeError("restore failed")
+    assert not obs_db.bulk_mode
+    assert len(obs_db.get_logs_by_session("sess-1")) == 1
+    assert obs_db.get_sessions("sess-3") == []
+
+
+@pytest.mark.unit
+def test_get_sessions(obs_db):
+    assert obs_db.get_sessions() == []
+
+    obs_db.create_obs_session(1700000200, 51.0, 4.0, "UTC", "sess-2")
+    obs_db.create_obs_session(1700000300, 52.0, 5.0, "UTC", "sess-empty")
+    obs_db.log_objects(
+        [_row("M", 31, 1700000100.0), _row("M", 32, 1700007300.0)]
+        + [("sess-2", 1700000000.0 + 900 * i, "NGC", i, {}, {}) for i in range(3)]
+    )
+
+    sessions = obs_db.get_sessions()
+    assert [sess["UID"] for sess in sessions] == ["sess-1", "sess-2"]
+    assert sessions[0] == {
+        "UID": "sess-1",
+        "timezone": "Europe/Brussels",
+        "start_time_local": "2023-11-14 22:13:20",
+        "lat": 50.0,
+        "lon": 3.0,
+        "observations": 2,
+        "duration": 2,
+    }
+    assert sessions[1]["observations"] == 3
+    assert obs_db.get_sessions("sess-2") == sessions[1:]
+    assert obs_db.get_sessions("sess-empty") == []
+
+
+@pytest.mark.unit
+def test_filter_logged(obs_db):
+    obs_db.log_objects([_row("M", 31), _row("NGC", 7000)])
+    obs_db.load_observed_objects_cache()
+    records = [_obj("M", 31), _obj("M", 32), _obj("NGC", 7000), _obj("IC", 1)]
+    assert obs_db.filter_logged(records) == [records[0], records[2]]
+    assert obs_db.filter_logged([]) == []
+
+
+@pytest.mark.unit
+def test_commits_land_in_main_file(obs_db, tmp_path):
+    # backup/restore copy observations.db on its own, so committed
+    # observations must not be left behind in a -wal file
+    obs_db.log_objects([_row("M", seq) for seq in range(1, 21)])
+    assert not (tmp_path / "observations.db-wal").exists()
+
+    copy_path = tmp_path / "copy.db"
+    copy_path.write_bytes((tmp_path / "observations.db").read_bytes())
+    copy = sqlite3.connect(copy_path)
+    try:
+        assert copy.execute("select count(*) from obs_objects").fetchone()[0] == 20
+    finally:
+        copy.close()
+
+
+@pytest.mark.unit
+def test_wal_db_converted_on_open(tmp_path):
+    db_path = tmp_path / "observations.db"
+    ObservationsDatabase(db_path).close()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.close()
+
+    db = ObservationsDatabase(db_path)
+    try:
+        mode = db.cursor.execute("PRAGMA journal_mode;").fetchone()[0]
+        assert mode == "delete"
+    finally:
+        db.close()
+
+
+@pytest.mark.unit
+def test_close_after_failed_flush(tmp_path):
+    db = ObservationsDatabase(tmp_path / "observations.db")
+    db.log_object(*_row(["bad"], 1), auto_commit=False)
+    with pytest.raises(sqlite3.Error):
+        db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.conn.execute("select 1")